@@ -17,21 +17,37 @@
 # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND.
 
 import argparse
+import atexit
+import gzip
 import hashlib
 import json
 import os
+import queue
+import random
+import sqlite3
 import sys
+import threading
 import time
+from array import array
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 from typing import Any
 
 # Logger
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 
-from dyntaxa_sqlite import db_open, begin_run, end_run, upsert_taxon, deactivate_missing_species
+from dyntaxa_sqlite import (
+    db_open, begin_run, end_run, upsert_taxa_bulk, deactivate_missing_species, bulk_load_pragmas, bulk_sync,
+    taxa_is_empty, load_taxon_state, ensure_hash_algo, canon_json_bytes,
+)
 
 
 # Repo root
@@ -63,16 +79,40 @@ HTTP_TIMEOUT_DEFAULT = 30
 
 REFRESH_TTL_SECONDS_DEFAULT = int(os.getenv("DYNTAXA_CACHE_TTL_SECONDS", "0"))
 POST_BATCH_SIZE_DEFAULT = int(os.getenv("DYNTAXA_POST_BATCH_SIZE", "200"))
+POST_BATCH_SIZE_MIN = 50
+POST_BATCH_SIZE_MAX = int(os.getenv("DYNTAXA_POST_BATCH_SIZE_MAX", "2000"))
+POST_CONCURRENCY_DEFAULT = int(os.getenv("DYNTAXA_POST_CONCURRENCY", "8"))
+RATE_LIMIT_DEFAULT = float(os.getenv("DYNTAXA_RATE_LIMIT", "2.9"))  # requests/s
+HTTP_MAX_RETRIES_DEFAULT = int(os.getenv("DYNTAXA_HTTP_RETRIES", "5"))
+# gzip-nivå för payloads i cachen; 0 = lagra okomprimerat (snabbare läsning, större fil)
+CACHE_COMPRESS_LEVEL = int(os.getenv("DYNTAXA_CACHE_COMPRESS_LEVEL", "3"))
+HTTP_BACKOFF_BASE_SECONDS = 1.0
+EPOCH_THRESHOLD = 1_000_000_000  # större värden i reset-huvuden tolkas som epoch-sekunder
 FAST_EXIT_ON_UNCHANGED_SOURCE_DEFAULT = os.getenv("DYNTAXA_FAST_EXIT", "1") == "1"
 
 DEFAULT_VERBOSE = os.getenv("DYNTAXA_VERBOSE", "1") == "1"
 
+# Innehållshash för ändringsdetektering (inte säkerhet). blake3 är snabbare men
+# valfritt beroende; vid byte av algoritm hashas cache och databas om en gång.
+HASH_ALGO = os.getenv("DYNTAXA_HASH_ALGO", "sha256").lower()
+if HASH_ALGO == "blake3":
+    try:
+        from blake3 import blake3 as _blake3
+    except ImportError:
+        print("DYNTAXA_HASH_ALGO=blake3 kräver paketet blake3. Kör: pip install blake3", file=sys.stderr)
+        sys.exit(1)
+elif HASH_ALGO != "sha256":
+    print(f"Okänd DYNTAXA_HASH_ALGO={HASH_ALGO!r} (sha256 eller blake3).", file=sys.stderr)
+    sys.exit(1)
+
 
 # ========= Logging =========
 REPO_ROOT = Path(__file__).resolve().parents[1]
 LOG_DIR = Path(os.getenv("DYNTAXA_LOG_DIR", str(REPO_ROOT / "logs")))
 LOG_FILE = LOG_DIR / "dyntaxa_refresh.log"
 
+log = logging.getLogger("dyntaxa")
+
 def setup_logging(verbose: bool = False) -> logging.Logger:
     LOG_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -99,8 +139,13 @@ def setup_logging(verbose: bool = False) -> logging.Logger:
     ch.setLevel(logging.DEBUG if verbose else logging.INFO)
     ch.setFormatter(formatter)
 
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    # Fil/konsol skrivs från en bakgrundstråd; loggning i heta loopar blir bara en kö-insättning
+    q: queue.Queue = queue.Queue(-1)
+    listener = QueueListener(q, fh, ch, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.addHandler(QueueHandler(q))
 
     # Undvik dubbla handlers vid import/test
     logger.propagate = False
@@ -111,35 +156,172 @@ def setup_logging(verbose: bool = False) -> logging.Logger:
 def _now() -> int:
     return int(time.time())
 
-def _sha256_bytes(b: bytes) -> str:
-    return hashlib.sha256(b).hexdigest()
+def _hash_digest(b: bytes) -> bytes:
+    # Rå 32-byte digest; så lagras taxonhashar i cachen och i SQLite (BLOB)
+    if HASH_ALGO == "blake3":
+        return _blake3(b).digest()
+    return hashlib.sha256(b).digest()
+
+def _hash_bytes(b: bytes) -> str:
+    return _hash_digest(b).hex()
 
 def _dump_json(path: Path, obj: Any) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(obj, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    path.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
 
 def _read_json(path: Path) -> Any:
-    return json.loads(path.read_text(encoding="utf-8"))
+    return orjson.loads(path.read_bytes())
 
-def taxon_sha256(obj: dict) -> str:
-    raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
-    return _sha256_bytes(raw)
+def _canon_bytes(obj: Any) -> bytes:
+    # Kompakt, sorterad UTF-8 => samma bytes som json.dumps(sort_keys=True, ensure_ascii=False)
+    return canon_json_bytes(obj)
 
 def _stable_ids_hash(lepidoptera_id: int, child_ids: list[int]) -> str:
-    ids = sorted(int(x) for x in child_ids)
-    raw = json.dumps(
-        {"root": int(lepidoptera_id), "childIds": ids},
-        ensure_ascii=False,
-        separators=(",", ":"),
-        sort_keys=True,
-    ).encode("utf-8")
-    return _sha256_bytes(raw)
+    # Hasha sorterade id:n som råa int64 (little-endian) i stället för JSON-text.
+    ids = array("q", sorted(child_ids))
+    root = array("q", [int(lepidoptera_id)])
+    if sys.byteorder == "big":
+        ids.byteswap()
+        root.byteswap()
+    return _hash_bytes(b"L" + root.tobytes() + ids.tobytes())
+
+# ========= HTTP =========
+class _RateLimiter:
+    """
+    Trådsäker token bucket för anrop mot Artdatabanken.
+    Startar försiktigt och justeras efter X-RateLimit-* / Retry-After i svaren.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self._lock = threading.Lock()
+        self._rate = max(rate, 0.1)
+        self._tokens = 1.0
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._rate = max(rate, 0.1)
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                capacity = max(1.0, self._rate)
+                self._tokens = min(capacity, self._tokens + (now - self._last) * self._rate)
+                self._last = now
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return
+                    wait = (1.0 - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers) -> None:
+        remaining = _header_float(headers, "X-RateLimit-Remaining")
+        reset = _header_seconds(headers, "X-RateLimit-Reset")
+        if remaining is None or reset is None or reset <= 0:
+            return
+        if remaining <= 0:
+            self.pause(reset)
+        else:
+            self.set_rate(remaining / reset)
+
+RATE_LIMITER = _RateLimiter(RATE_LIMIT_DEFAULT)
+
+# En gemensam session => keep-alive och återanvända TCP/TLS-anslutningar.
+# Retry på 429/5xx sköts av _http_request, inte av urllib3.
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+atexit.register(SESSION.close)
+
+def _mount_session_pool(pool_size: int) -> None:
+    # En värd => få poolnycklar, men minst en anslutning per samtidig batch.
+    SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max(pool_size, 1)))
+
+_mount_session_pool(POST_CONCURRENCY_DEFAULT)
+
+def _header_float(headers, name: str) -> float | None:
+    v = headers.get(name)
+    if v is None:
+        return None
+    try:
+        return float(v)
+    except ValueError:
+        return None
 
-def _http_get_json(url: str, *, params: dict | None = None, timeout: int) -> tuple[int, dict | None, dict]:
-    r = requests.get(url, headers=HEADERS, params=params, timeout=timeout)
+def _header_seconds(headers, name: str) -> float | None:
+    """
+    Väntetid i sekunder från t.ex. Retry-After / X-RateLimit-Reset.
+    Klarar sekunder, epoch-tidsstämpel och HTTP-datum.
+    """
+    v = headers.get(name)
+    if v is None:
+        return None
+    try:
+        x = float(v)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(v).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    if x > EPOCH_THRESHOLD:
+        return max(0.0, x - time.time())
+    return x
+
+def _retry_delay(r: requests.Response | None, attempt: int) -> float:
+    if r is not None:
+        retry_after = _header_seconds(r.headers, "Retry-After")
+        if retry_after is not None:
+            return retry_after
+    return HTTP_BACKOFF_BASE_SECONDS * 2 ** attempt + random.random()
+
+def _http_request(
+    method: str, url: str, *, status_retries: int = HTTP_MAX_RETRIES_DEFAULT, **kwargs
+) -> requests.Response:
+    """
+    Rate-limitat anrop med retry + exponentiell back-off på 429/5xx och nätverksfel.
+    status_retries gäller 5xx/timeout; 429 och anslutningsfel (t.ex. en nedkopplad
+    keep-alive-socket) försöks alltid om upp till HTTP_MAX_RETRIES_DEFAULT.
+    Sista svaret returneras oavsett status; anroparen hanterar fel.
+    """
+    attempt = 0
+    while True:
+        RATE_LIMITER.acquire()
+        try:
+            r = SESSION.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # ConnectTimeout är både ConnectionError och Timeout => räknas som timeout
+            limit = status_retries if isinstance(e, requests.Timeout) else HTTP_MAX_RETRIES_DEFAULT
+            if attempt >= limit:
+                raise
+            time.sleep(_retry_delay(None, attempt))
+            attempt += 1
+            continue
+
+        RATE_LIMITER.update_from_headers(r.headers)
+        if (
+            (r.status_code == 429 and attempt < HTTP_MAX_RETRIES_DEFAULT)
+            or (r.status_code >= 500 and attempt < status_retries)
+        ):
+            delay = _retry_delay(r, attempt)
+            if r.status_code == 429:
+                RATE_LIMITER.pause(delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        return r
 
-    if r.status_code == 404:
-        return 404, None, dict(r.headers)
+def _http_get_json(url: str, *, params: dict | None = None, timeout: int, headers: dict | None = None) -> tuple[int, dict | None, dict]:
+    r = _http_request("GET", url, params=params, headers=headers, timeout=timeout)
+
+    if r.status_code in (304, 404):
+        return r.status_code, None, dict(r.headers)
 
     if not r.ok:
         try:
@@ -150,14 +332,26 @@ def _http_get_json(url: str, *, params: dict | None = None, timeout: int) -> tup
         print(f"HTTP {r.status_code} {r.reason}\nURL: {r.url}\nBody:\n{pretty}", file=sys.stderr)
         r.raise_for_status()
 
-    return r.status_code, r.json(), dict(r.headers)
+    return r.status_code, orjson.loads(r.content), dict(r.headers)
 
-def _http_post_json(url: str, *, params: dict | None = None, body: dict | None = None, timeout: int) -> tuple[int, Any, dict]:
-    headers = dict(HEADERS)
-    headers["Content-Type"] = "application/json-patch+json"
+def _http_post_json(
+    url: str,
+    *,
+    params: dict | None = None,
+    body: dict | None = None,
+    timeout: int,
+    status_retries: int = HTTP_MAX_RETRIES_DEFAULT,
+) -> tuple[int, Any, dict]:
+    headers = {"Content-Type": "application/json-patch+json"}
 
-    r = requests.post(url, headers=headers, params=params, json=body, timeout=timeout)
+    # Kroppen kodas med orjson till bytes (json= går via stdlib json i requests); svaret
+    # parsas direkt från r.content utan att först avkodas till str.
+    data = orjson.dumps(body) if body is not None else None
+    r = _http_request("POST", url, headers=headers, params=params, data=data, timeout=timeout, status_retries=status_retries)
 
+    if r.status_code == 413:
+        # för stor batch: hanteras av den adaptiva batchstorleken, ingen feldump
+        r.raise_for_status()
     if not r.ok:
         try:
             j = r.json()
@@ -167,15 +361,46 @@ def _http_post_json(url: str, *, params: dict | None = None, body: dict | None =
         print(f"HTTP {r.status_code} {r.reason}\nURL: {r.url}\nBody:\n{pretty}", file=sys.stderr)
         r.raise_for_status()
 
-    return r.status_code, r.json(), dict(r.headers)
+    return r.status_code, orjson.loads(r.content), dict(r.headers)
+
+def _get_json_revalidated(url: str, *, params: dict | None, timeout: int, cache_path: Path) -> tuple[int, Any]:
+    """
+    GET med villkorlig revalidering mot en lokal kopia i cache_path.
+    ETag/Last-Modified sparas i <stem>.http.json bredvid; vid 304 läses den lokala kopian.
+    """
+    state_path = cache_path.with_name(cache_path.stem + ".http.json")
+    headers = {}
+    try:
+        state = _read_json(state_path)
+    except (FileNotFoundError, ValueError):
+        state = None
+    if state and state.get("url") == url and state.get("params") == params and cache_path.exists():
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("lastModified"):
+            headers["If-Modified-Since"] = state["lastModified"]
+
+    status, payload, hdrs = _http_get_json(url, params=params, timeout=timeout, headers=headers or None)
+    if status == 304:
+        log.debug("304 Not Modified, återanvänder %s", cache_path)
+        return 200, _read_json(cache_path)
 
-def _chunk(seq: list[int], n: int):
-    for i in range(0, len(seq), n):
-        yield seq[i:i + n]
+    if status == 200 and payload is not None:
+        # Maskinläst fil: kompakt, utan indentering
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_bytes(orjson.dumps(payload))
+        lower = {k.lower(): v for k, v in hdrs.items()}
+        state_path.write_bytes(orjson.dumps({
+            "url": url,
+            "params": params,
+            "etag": lower.get("etag"),
+            "lastModified": lower.get("last-modified"),
+        }))
+    return status, payload
 
 
 # ========= Dyntaxa-specific =========
-def find_taxon_id_lepidoptera(*, culture: str, timeout: int) -> int:
+def find_taxon_id_lepidoptera(*, culture: str, timeout: int, cache_path: Path | None = None) -> int:
     params = {
         "searchString": "Lepidoptera",
         "searchFields": "Both",
@@ -185,7 +410,10 @@ def find_taxon_id_lepidoptera(*, culture: str, timeout: int) -> int:
         "page": 1,
         "pageSize": 100,
     }
-    status, payload, _hdrs = _http_get_json(NAMES_URL, params=params, timeout=timeout)
+    if cache_path is not None:
+        status, payload = _get_json_revalidated(NAMES_URL, params=params, timeout=timeout, cache_path=cache_path)
+    else:
+        status, payload, _hdrs = _http_get_json(NAMES_URL, params=params, timeout=timeout)
     if status != 200 or not isinstance(payload, dict):
         raise RuntimeError(f"Oväntat svar från names: status={status} payload={payload}")
 
@@ -193,29 +421,28 @@ def find_taxon_id_lepidoptera(*, culture: str, timeout: int) -> int:
     if not items:
         raise RuntimeError(f"Inga träffar i 'data'. Svar: {payload}")
 
+    # Ett pass: exakt träff returneras direkt, namnträff sparas som reserv.
+    fallback = None
     for it in items:
-        ti = it.get("taxonInformation", {}) or {}
-        rec_sci = ti.get("recommendedScientificName")
-        category = (it.get("category", {}) or {}).get("value")
-        ttype = (it.get("type", {}) or {}).get("value")
-        statusv = (it.get("status", {}) or {}).get("value")
-        if rec_sci == "Lepidoptera" and category == "Order" and ttype == "Taxonomic" and statusv == "Accepted":
-            return int(ti["taxonId"])
-
-    for it in items:
-        ti = it.get("taxonInformation", {}) or {}
-        if it.get("name") == "Lepidoptera" and ti.get("recommendedScientificName") == "Lepidoptera":
+        ti = it.get("taxonInformation") or {}
+        if ti.get("recommendedScientificName") != "Lepidoptera":
+            continue
+        if _value_triple(it) == ("Order", "Taxonomic", "Accepted"):
             return int(ti["taxonId"])
+        if fallback is None and it.get("name") == "Lepidoptera":
+            fallback = int(ti["taxonId"])
 
+    if fallback is not None:
+        return fallback
     raise RuntimeError("Kunde inte entydigt hitta Lepidoptera.")
 
 def fetch_children_ids(taxon_id: int, *, out_path: Path, timeout: int) -> dict:
     url = CHILDIDS_URL_TEMPLATE.format(taxon_id=taxon_id)
     params = {"useMainChildren": "false"}
-    status, payload, _hdrs = _http_get_json(url, params=params, timeout=timeout)
+    # out_path är både utdata och lokal kopia för villkorlig GET (304 => ingen överföring)
+    status, payload = _get_json_revalidated(url, params=params, timeout=timeout, cache_path=out_path)
     if status != 200 or payload is None:
         raise RuntimeError(f"Misslyckades hämta childids: status={status} payload={payload}")
-    _dump_json(out_path, payload)
     return payload
 
 def _extract_child_ids(child_ids_payload: Any) -> list[int]:
@@ -225,137 +452,386 @@ def _extract_child_ids(child_ids_payload: Any) -> list[int]:
         ids = child_ids_payload.get("taxonIds") or child_ids_payload.get("data") or []
     else:
         ids = []
-    return [int(x) for x in ids]
+    return list(map(int, ids))
 
 
 # ========= Cache =========
-def _cache_paths(cache_dir: Path, taxon_id: int) -> tuple[Path, Path]:
-    sub = f"{taxon_id // 10000:04d}"
-    data_path = cache_dir / sub / f"{taxon_id}.json"
-    meta_path = cache_dir / sub / f"{taxon_id}.meta.json"
-    return data_path, meta_path
+# Hela cachen ligger i en SQLite-fil i cache-katalogen: en rad per taxon med status,
+# fetched_at, sha256 och payload (gzip-komprimerade kanoniska JSON-bytes). En fil i
+# stället för en payload-fil per taxon => inga open()/stat() per taxon vid cache-passet.
+# is_species/species_row är artfiltret och extract_names() för payloaden, beräknade vid
+# skrivning, så att artpasset klarar sig utan att avkoda oförändrade payloads.
+CACHE_DB_NAME = "cache.sqlite"
+GZIP_MAGIC = b"\x1f\x8b"
+
+CACHE_SCHEMA_SQL = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+
+CREATE TABLE IF NOT EXISTS cache (
+  taxon_id   INTEGER PRIMARY KEY,
+  status     INTEGER NOT NULL,
+  fetched_at INTEGER NOT NULL,
+  sha256     BLOB,
+  payload    BLOB,
+  is_species INTEGER,
+  species_row TEXT
+);
+
+CREATE TABLE IF NOT EXISTS cache_info (
+  key   TEXT PRIMARY KEY,
+  value TEXT NOT NULL
+);
+"""
+
+# Fler id:n än så => hela tabellen skannas i stället för punktuppslag
+CACHE_FULL_SCAN_MIN_IDS = 500
+CACHE_CACHED_STATEMENTS = 256
+
+# Fasta SQL-strängar => varje sats kompileras en gång per anslutning (statement-cachen)
+CACHE_META_COLUMNS = "status, fetched_at, sha256, payload IS NOT NULL"
+CACHE_SPECIES_COLUMNS = "status, fetched_at, sha256, payload IS NOT NULL, is_species, species_row"
+CACHE_PAYLOAD_COLUMNS = "payload"
+
+SQL_CACHE_WRITE_ROW = "INSERT OR REPLACE INTO cache(taxon_id,status,fetched_at,sha256,payload,is_species,species_row) VALUES(?,?,?,?,?,?,?)"
+SQL_CACHE_WRITE_SPECIES = "UPDATE cache SET is_species=?, species_row=? WHERE taxon_id=?"
+SQL_CACHE_INFO_GET = "SELECT value FROM cache_info WHERE key=?"
+SQL_CACHE_INFO_SET = "INSERT INTO cache_info(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value"
+
+# Äldre filbaserad cache: <bucket>/<taxonId>.json + <bucket>/<taxonId>.meta.json
+LEGACY_CACHE_BUCKET_SIZE = 10000
+
+def _cache_compress(canon: bytes) -> bytes:
+    if CACHE_COMPRESS_LEVEL <= 0:
+        return canon
+    return gzip.compress(canon, compresslevel=CACHE_COMPRESS_LEVEL, mtime=0)
+
+def _cache_decompress(blob: bytes) -> bytes:
+    # Kanonisk JSON börjar aldrig med gzip-magin => komprimerade och okomprimerade
+    # payloads kan blandas, t.ex. efter byte av DYNTAXA_CACHE_COMPRESS_LEVEL.
+    return gzip.decompress(blob) if blob[:2] == GZIP_MAGIC else blob
+
+def cache_open(cache_dir: Path) -> sqlite3.Connection:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(str(cache_dir / CACHE_DB_NAME), cached_statements=CACHE_CACHED_STATEMENTS)
+    con.executescript(CACHE_SCHEMA_SQL)
+    if con.execute("SELECT 1 FROM cache LIMIT 1").fetchone() is None:
+        _import_legacy_cache(con, cache_dir)
+    with con:
+        # cachar från före DYNTAXA_HASH_ALGO är sha256
+        con.execute("INSERT OR IGNORE INTO cache_info(key,value) VALUES('hash_algo','sha256')")
+    _cache_ensure_hash_algo(con)
+    return con
+
+def _cache_ensure_hash_algo(cache_con: sqlite3.Connection) -> None:
+    # Engångsomhashning av payloads när DYNTAXA_HASH_ALGO byts, så att sha256-kolumnen
+    # alltid är jämförbar med _hash_digest() och taxa.sha256 i SQLite.
+    (algo,) = cache_con.execute(SQL_CACHE_INFO_GET, ("hash_algo",)).fetchone()
+    if algo == HASH_ALGO:
+        return
+    rows = [
+        (_hash_digest(_cache_decompress(blob)), tid)
+        for tid, blob in cache_con.execute("SELECT taxon_id, payload FROM cache WHERE payload IS NOT NULL")
+    ]
+    with cache_con:
+        cache_con.executemany("UPDATE cache SET sha256=? WHERE taxon_id=?", rows)
+        cache_con.execute(SQL_CACHE_INFO_SET, ("hash_algo", HASH_ALGO))
+    log.info("Cache: %d poster omhashade %s -> %s", len(rows), algo, HASH_ALGO)
+
+def _legacy_cache_metas(cache_dir: Path) -> list[tuple[int, int, int, str | None]]:
+    rows = []
+    for meta_path in cache_dir.glob("*/*.meta.json"):
+        try:
+            meta = _read_json(meta_path)
+            rows.append((int(meta["taxon_id"]), int(meta.get("status", 0)), int(meta.get("fetched_at", 0)), meta.get("sha256")))
+        except Exception:
+            continue
+    return rows
+
+def _legacy_cache_blob(cache_dir: Path, taxon_id: int) -> bytes | None:
+    bucket_dir = cache_dir / f"{taxon_id // LEGACY_CACHE_BUCKET_SIZE:04d}"
+    try:
+        canon = _canon_bytes(_read_json(bucket_dir / f"{taxon_id}.json"))
+    except FileNotFoundError:
+        return None
+    return _cache_compress(canon)
+
+def _import_legacy_cache(cache_con: sqlite3.Connection, cache_dir: Path) -> None:
+    # Engångsimport av den filbaserade cachen så att befintliga payloads återanvänds.
+    # De gamla filerna lämnas kvar och kan tas bort för hand.
+    rows = []
+    for tid, status, fetched_at, sha in _legacy_cache_metas(cache_dir):
+        blob = None
+        if status == 200:
+            try:
+                blob = _legacy_cache_blob(cache_dir, tid)
+            except Exception:
+                blob = None
+            if blob is None:
+                continue
+        # artkolumnerna lämnas NULL och fylls i av första artpasset; filcachen har hex-hashar
+        rows.append((tid, status, fetched_at, bytes.fromhex(sha) if sha else None, blob, None, None))
+    if rows:
+        _write_cache_rows(cache_con, rows)
+        log.info("Cache: importerade %d poster från filbaserad cache i %s", len(rows), cache_dir)
+
+def _cache_select(cache_con: sqlite3.Connection, columns: str, taxon_ids: list[int]) -> dict[int, tuple]:
+    # columns är en av CACHE_*_COLUMNS => SQL-texten är densamma vid varje anrop
+    out: dict[int, tuple] = {}
+    if len(taxon_ids) > CACHE_FULL_SCAN_MIN_IDS:
+        # Många id:n (hela child-listan): en sekventiell tabellskanning är billigare än
+        # punktuppslag, eftersom cachen i praktiken bara innehåller just dessa taxa.
+        wanted = set(taxon_ids)
+        for tid, *rest in cache_con.execute(f"SELECT taxon_id, {columns} FROM cache"):
+            if tid in wanted:
+                out[tid] = tuple(rest)
+        return out
+    # id-listan som en JSON-parameter => en sats oavsett antal id:n
+    for tid, *rest in cache_con.execute(
+        f"SELECT taxon_id, {columns} FROM cache WHERE taxon_id IN (SELECT value FROM json_each(?))",
+        (orjson.dumps(taxon_ids).decode(),),
+    ):
+        out[tid] = tuple(rest)
+    return out
+
+def _cache_meta_load(cache_con: sqlite3.Connection, taxon_ids: list[int]) -> dict[int, dict]:
+    return {
+        tid: {"status": status, "fetched_at": fetched_at, "sha256": sha, "has_payload": bool(has_payload)}
+        for tid, (status, fetched_at, sha, has_payload) in _cache_select(
+            cache_con, CACHE_META_COLUMNS, taxon_ids
+        ).items()
+    }
+
+def _cache_species_load(cache_con: sqlite3.Connection, taxon_ids: list[int]) -> dict[int, tuple[dict, int | None, str | None]]:
+    # Meta + artkolumner (utan payload) i samma skanning; används av artpasset i main().
+    return {
+        tid: ({"status": status, "fetched_at": fetched_at, "sha256": sha, "has_payload": bool(has_payload)}, is_species, species_row)
+        for tid, (status, fetched_at, sha, has_payload, is_species, species_row) in _cache_select(
+            cache_con, CACHE_SPECIES_COLUMNS, taxon_ids
+        ).items()
+    }
 
-def _cache_needs_refresh(meta: dict, ttl_seconds: int) -> bool:
+def _cache_payload_load(cache_con: sqlite3.Connection, taxon_ids: list[int]) -> dict[int, bytes]:
+    return {
+        tid: blob
+        for tid, (blob,) in _cache_select(cache_con, CACHE_PAYLOAD_COLUMNS, taxon_ids).items()
+        if blob is not None
+    }
+
+def _cache_needs_refresh(meta: dict, ttl_seconds: int, now: int | None = None) -> bool:
+    # now = en tidsstämpel för hela passet när många poster prövas i en loop
     fetched_at = int(meta.get("fetched_at", 0))
     if fetched_at <= 0:
         return True
     if ttl_seconds <= 0:
         return False
-    return (_now() - fetched_at) >= ttl_seconds
-
-def get_taxon_cached(cache_dir: Path, taxon_id: int, ttl_seconds: int) -> dict | None:
-    data_path, meta_path = _cache_paths(cache_dir, taxon_id)
-    if data_path.exists() and meta_path.exists():
-        meta = _read_json(meta_path)
-        if not _cache_needs_refresh(meta, ttl_seconds) and int(meta.get("status", 0)) == 200:
-            return _read_json(data_path)
-    return None
-
-def _write_cache(cache_dir: Path, taxon_id: int, status: int, payload: dict | None) -> None:
-    data_path, meta_path = _cache_paths(cache_dir, taxon_id)
-    meta_path.parent.mkdir(parents=True, exist_ok=True)
-
-    meta = {
-        "taxon_id": taxon_id,
-        "status": status,
-        "fetched_at": _now(),
-    }
+    return ((now if now is not None else _now()) - fetched_at) >= ttl_seconds
+
+def _cache_entry_valid(meta: dict | None, ttl_seconds: int, now: int | None = None) -> bool:
+    # Giltig 200-post med payload inom TTL
+    return (
+        meta is not None
+        and meta["has_payload"]
+        and int(meta["status"]) == 200
+        and not _cache_needs_refresh(meta, ttl_seconds, now)
+    )
 
+def _species_columns(obj: dict) -> tuple[int, str | None]:
+    # (is_species, species_row) för cachetabellen
+    if not is_species_accepted_taxonomic(obj):
+        return 0, None
+    return 1, orjson.dumps(extract_names(obj)).decode()
+
+def _encode_cache_row(taxon_id: int, status: int, payload: dict | None, fetched_at: int) -> tuple:
+    """
+    Bygg cacheraden (taxon_id, status, fetched_at, sha256, payload, is_species, species_row).
+    Rör inte databasen => kodning/hash/komprimering kan köras i arbetstrådarna.
+    """
+    sha = blob = is_species = species_row = None
     if status == 200 and payload is not None:
-        meta["sha256"] = taxon_sha256(payload)
-        _dump_json(data_path, payload)
-    else:
-        if data_path.exists():
-            data_path.unlink(missing_ok=True)
-
-    _dump_json(meta_path, meta)
-
-def _taxon_ids_to_fetch(cache_dir: Path, all_ids: list[int], ttl_seconds: int) -> list[int]:
+        # Serialisera en gång: samma kanoniska bytes hashas och lagras.
+        canon = _canon_bytes(payload)
+        sha = _hash_digest(canon)
+        blob = _cache_compress(canon)
+        is_species, species_row = _species_columns(payload)
+    return taxon_id, status, fetched_at, sha, blob, is_species, species_row
+
+def _write_cache_rows(cache_con: sqlite3.Connection, rows: list[tuple]) -> None:
+    with cache_con:
+        cache_con.executemany(SQL_CACHE_WRITE_ROW, rows)
+
+def _write_cache_species(cache_con: sqlite3.Connection, rows: list[tuple[int, str | None, int]]) -> None:
+    # Fyll i artkolumnerna för poster skrivna innan kolumnerna fanns: (is_species, species_row, taxon_id)
+    with cache_con:
+        cache_con.executemany(SQL_CACHE_WRITE_SPECIES, rows)
+
+def _taxon_ids_to_fetch(cache_con: sqlite3.Connection, all_ids: list[int], ttl_seconds: int) -> list[int]:
+    metas = _cache_meta_load(cache_con, all_ids)
+    now = _now()
     out: list[int] = []
     for tid in all_ids:
-        data_path, meta_path = _cache_paths(cache_dir, tid)
-        if not meta_path.exists() or not data_path.exists():
-            out.append(tid)
-            continue
-        try:
-            meta = _read_json(meta_path)
-        except Exception:
+        meta = metas.get(tid)
+        # Poster utan payload (404) hämtas om varje körning, precis som tidigare.
+        if meta is None or not meta["has_payload"]:
             out.append(tid)
             continue
-        if _cache_needs_refresh(meta, ttl_seconds):
+        if _cache_needs_refresh(meta, ttl_seconds, now):
             out.append(tid)
     return out
 
+def _fetch_batch(batch: list[int], *, params: dict, timeout: int, status_retries: int = HTTP_MAX_RETRIES_DEFAULT) -> list[tuple]:
+    status, payload, _hdrs = _http_post_json(
+        TAXA_POST_URL,
+        params=params,
+        body={"taxonIds": batch},
+        timeout=timeout,
+        status_retries=status_retries,
+    )
+    if status != 200 or not isinstance(payload, list):
+        raise RuntimeError(f"Oväntat svar från POST /taxa: status={status} payload_type={type(payload)}")
+
+    # hela batchen hämtades i samma anrop => en fetched_at
+    fetched_at = _now()
+    rows = []
+    returned_ids = set()
+    for obj in payload:
+        if not isinstance(obj, dict) or "taxonId" not in obj:
+            continue
+        tid = int(obj["taxonId"])
+        returned_ids.add(tid)
+        rows.append(_encode_cache_row(tid, 200, obj, fetched_at))
+
+    for tid in batch:
+        if tid not in returned_ids:
+            rows.append(_encode_cache_row(tid, 404, None, fetched_at))
+    return rows
+
+def _is_batch_size_error(e: Exception) -> bool:
+    if isinstance(e, requests.Timeout):
+        return True
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return status is not None and (status == 413 or status >= 500)
+
 def refresh_taxa_cache_batch(
-    cache_dir: Path,
+    cache_con: sqlite3.Connection,
     taxon_ids: list[int],
     *,
     culture: str,
     ttl_seconds: int,
     batch_size: int,
     timeout: int,
+    concurrency: int = POST_CONCURRENCY_DEFAULT,
 ) -> int:
-    to_fetch = _taxon_ids_to_fetch(cache_dir, taxon_ids, ttl_seconds)
+    to_fetch = _taxon_ids_to_fetch(cache_con, taxon_ids, ttl_seconds)
     if not to_fetch:
         return 0
 
     written_ok = 0
     params = {"culture": culture}
 
-    for batch in _chunk(to_fetch, batch_size):
-        status, payload, _hdrs = _http_post_json(
-            TAXA_POST_URL,
-            params=params,
-            body={"taxonIds": batch},
-            timeout=max(timeout, 60),
-        )
-
-        if status != 200 or not isinstance(payload, list):
-            raise RuntimeError(f"Oväntat svar från POST /taxa: status={status} payload_type={type(payload)}")
-
-        returned_ids = set()
-        for obj in payload:
-            if not isinstance(obj, dict) or "taxonId" not in obj:
-                continue
-            tid = int(obj["taxonId"])
-            returned_ids.add(tid)
-            _write_cache(cache_dir, tid, 200, obj)
-            written_ok += 1
-
-        for tid in batch:
-            if tid not in returned_ids:
-                _write_cache(cache_dir, tid, 404, None)
+    # Varje arbetstråd gör POST + kodning/hash/komprimering för sin batch, så CPU-arbetet
+    # överlappar med andra batchers nätverksanrop. Cache-databasen skrivs bara härifrån.
+    # Batchstorleken är adaptiv: växer från storleken på en lyckad batch (dubbelt, men högst
+    # halvvägs mot taket), halveras vid 413/timeout/5xx. En storlek som gett 413 sänker
+    # taket och försöks aldrig igen.
+    # Batchar över golvet försöks inte om vid timeout/5xx i _http_request (status_retries=0),
+    # så felen når halveringen direkt; på golvet gäller vanliga retries. Anslutningsfel
+    # försöks alltid om som vanligt, oavsett batchstorlek.
+    remaining = deque(to_fetch)
+    floor = max(1, min(batch_size, POST_BATCH_SIZE_MIN))
+    ceiling = POST_BATCH_SIZE_MAX
+    cur = max(floor, min(batch_size, ceiling))
+    workers = max(1, concurrency)
+    in_flight: dict = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            while remaining or in_flight:
+                while remaining and len(in_flight) < workers:
+                    batch = [remaining.popleft() for _ in range(min(cur, len(remaining)))]
+                    status_retries = HTTP_MAX_RETRIES_DEFAULT if len(batch) <= floor else 0
+                    fut = pool.submit(
+                        _fetch_batch, batch, params=params, timeout=max(timeout, 60), status_retries=status_retries
+                    )
+                    in_flight[fut] = batch
+
+                done, _pending = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    batch = in_flight.pop(fut)
+                    try:
+                        rows = fut.result()
+                    except (requests.HTTPError, requests.Timeout) as e:
+                        if not _is_batch_size_error(e) or len(batch) <= floor:
+                            raise
+                        if getattr(getattr(e, "response", None), "status_code", None) == 413:
+                            ceiling = max(floor, min(ceiling, len(batch) - 1))
+                        # min(): en äldre, större batch som faller sent får inte höja cur
+                        cur = min(cur, max(len(batch) // 2, floor))
+                        remaining.extendleft(reversed(batch))
+                        log.warning("POST /taxa batch=%d misslyckades (%s), ny batchstorlek=%d", len(batch), e, cur)
+                        continue
+
+                    _write_cache_rows(cache_con, rows)
+                    written_ok += sum(1 for r in rows if r[1] == 200)
+                    # växer från den storlek som faktiskt lyckades (sista batchen kan vara kortare),
+                    # högst halvvägs mot taket => taket från en 413 nås på ~log2 steg
+                    n = len(batch)
+                    grow = min(n * 2, n + (ceiling - n + 1) // 2)
+                    cur = min(max(cur, grow), ceiling)
+                    log.debug("POST /taxa batch=%d ok, nästa batchstorlek=%d", len(batch), cur)
+        except BaseException:
+            for f in in_flight:
+                f.cancel()
+            raise
 
     return written_ok
 
 
 # ========= Filtering / extraction =========
+def _value_triple(obj: dict) -> tuple[Any, Any, Any]:
+    # (category, type, status).value utan temporära tomma dictar
+    cat = obj.get("category")
+    ttype = obj.get("type")
+    statusv = obj.get("status")
+    return (
+        cat.get("value") if cat else None,
+        ttype.get("value") if ttype else None,
+        statusv.get("value") if statusv else None,
+    )
+
 def is_species_accepted_taxonomic(taxon_obj: dict) -> bool:
-    cat = (taxon_obj.get("category") or {}).get("value")
-    ttype = (taxon_obj.get("type") or {}).get("value")
-    statusv = (taxon_obj.get("status") or {}).get("value")
-    return (cat == "Species") and (ttype == "Taxonomic") and (statusv == "Accepted")
-
-def _recommended_name(taxon_obj: dict, name_category_value: str) -> str | None:
-    for n in taxon_obj.get("names", []) or []:
-        cat = (n.get("category") or {}).get("value")
-        if cat == name_category_value and n.get("isRecommended") is True:
-            return n.get("name")
-    return None
+    return _value_triple(taxon_obj) == ("Species", "Taxonomic", "Accepted")
+
+def _recommended_names(taxon_obj: dict) -> tuple[str | None, str | None]:
+    # Ett pass över names: första rekommenderade vetenskapliga resp. svenska namn.
+    sci = swe = None
+    sci_found = swe_found = False
+    for n in taxon_obj.get("names") or ():
+        if n.get("isRecommended") is not True:
+            continue
+        cat_obj = n.get("category")
+        cat = cat_obj.get("value") if cat_obj else None
+        if cat == "ScientificName" and not sci_found:
+            sci, sci_found = n.get("name"), True
+        elif cat == "SwedishName" and not swe_found:
+            swe, swe_found = n.get("name"), True
+        if sci_found and swe_found:
+            break
+    return sci, swe
 
 def extract_names(taxon_obj: dict) -> dict:
-    sci = _recommended_name(taxon_obj, "ScientificName")
-    swe = _recommended_name(taxon_obj, "SwedishName")
+    sci, swe = _recommended_names(taxon_obj)
     genus = sci.split(" ", 1)[0] if isinstance(sci, str) and " " in sci else (sci if isinstance(sci, str) else None)
+    cat, ttype, statusv = _value_triple(taxon_obj)
 
     return {
         "taxonId": int(taxon_obj.get("taxonId")),
         "scientificName": sci,
         "swedishName": swe,
         "genus": genus,
-        "category": (taxon_obj.get("category") or {}).get("value"),
-        "type": (taxon_obj.get("type") or {}).get("value"),
-        "status": (taxon_obj.get("status") or {}).get("value"),
+        "category": cat,
+        "type": ttype,
+        "status": statusv,
     }
 
 
@@ -383,12 +859,15 @@ def parse_args() -> argparse.Namespace:
 
     p.add_argument("--force", action="store_true", help="Run even if source revision unchanged (ignore fast-exit).")
     p.add_argument("--no-sqlite", action="store_true", help="Skip SQLite update step.")
+    p.add_argument("--bulk-load", action="store_true", help="Drop the secondary taxa indexes during the SQLite load and rebuild them afterwards (automatic on first run).")
     p.add_argument("--only-refresh-cache", action="store_true", help="Only refresh cache (POST /taxa batches).")
     p.add_argument("--only-build-lists", action="store_true", help="Only build lists from cache; do not refresh via POST /taxa.")
 
     p.add_argument("--culture", default=os.getenv("DYNTAXA_CULTURE", "sv_SE"), help="Culture param (default: sv_SE).")
     p.add_argument("--ttl-seconds", type=int, default=REFRESH_TTL_SECONDS_DEFAULT, help="Cache TTL seconds (0 = new only).")
-    p.add_argument("--batch-size", type=int, default=POST_BATCH_SIZE_DEFAULT, help="POST /taxa batch size.")
+    p.add_argument("--batch-size", type=int, default=POST_BATCH_SIZE_DEFAULT, help="Initial POST /taxa batch size (adapts between 50 and DYNTAXA_POST_BATCH_SIZE_MAX).")
+    p.add_argument("--concurrency", type=int, default=POST_CONCURRENCY_DEFAULT, help="Parallel POST /taxa batches (default: 8).")
+    p.add_argument("--rate-limit", type=float, default=RATE_LIMIT_DEFAULT, help="Initial request rate per second (adjusted from X-RateLimit-* headers).")
     p.add_argument("--timeout", type=int, default=HTTP_TIMEOUT_DEFAULT, help="HTTP timeout seconds.")
 
     p.add_argument("--tmp-dir",type=Path,default=Path(os.getenv("DYNTAXA_TMP_DIR", str(CACHE_ROOT_DEFAULT))),help="Cache root dir (children/species lists + taxa_cache).",)
@@ -423,6 +902,8 @@ def main() -> None:
     args = parse_args()
     logger = setup_logging(verbose=args.verbose)
     logger.info("=== Dyntaxa refresh started ===")
+    RATE_LIMITER.set_rate(args.rate_limit)
+    _mount_session_pool(args.concurrency)
 
     tmp_dir: Path = args.tmp_dir
     cache_dir = tmp_dir / "taxa_cache"
@@ -431,11 +912,13 @@ def main() -> None:
     species_ids_file = tmp_dir / "species_ids_lepidoptera.json"
     species_table_file = tmp_dir / "species_table_lepidoptera.json"
     source_rev_file = tmp_dir / "lepidoptera_source_rev.json"
+    names_file = tmp_dir / "lepidoptera_names.json"
 
     tmp_dir.mkdir(parents=True, exist_ok=True)
     cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_con = cache_open(cache_dir)
 
-    lepidoptera_id = find_taxon_id_lepidoptera(culture=args.culture, timeout=args.timeout)
+    lepidoptera_id = find_taxon_id_lepidoptera(culture=args.culture, timeout=args.timeout, cache_path=names_file)
     #print(f"Dyntaxa database is online, Lepidoptera found as TaxonId {lepidoptera_id}, continuing ...")
     logger.info("Dyntaxa database is online")
     
@@ -470,17 +953,18 @@ def main() -> None:
             return
 
     # Refresh cache unless explicitly disabled
-    before_missing = sum(1 for tid in child_ids if not _cache_paths(cache_dir, tid)[1].exists())
+    before_missing = len(child_ids) - len(_cache_meta_load(cache_con, child_ids))
     written_ok = 0
 
     if not args.only_build_lists:
         written_ok = refresh_taxa_cache_batch(
-            cache_dir,
+            cache_con,
             child_ids,
             culture=args.culture,
             ttl_seconds=args.ttl_seconds,
             batch_size=args.batch_size,
             timeout=args.timeout,
+            concurrency=args.concurrency,
         )
 
     if args.only_refresh_cache:
@@ -501,18 +985,70 @@ def main() -> None:
     species_ids: list[int] = []
     species_table: list[dict] = []
 
+    # Artpasset läser bara meta + artkolumner ur cachen. Payloads avkodas enbart för taxa som
+    # ska skrivas till SQLite (sha skiljer sig från aktiv rad) eller saknar artkolumner.
+    # _encode_cache_row sätter alltid sha256 för status 200 => ingen omhashning här, och de
+    # kanoniska bytes som hashades följer med till SQLite som raw_json => ingen omkodning.
+    con = None if args.no_sqlite else db_open(args.db)
+    if con is not None:
+        rehashed = ensure_hash_algo(con, HASH_ALGO, _hash_digest)
+        if rehashed:
+            logger.info("SQLite: %d taxa omhashade till %s", rehashed, HASH_ALGO)
+    # (sha256, is_active) per taxon; återanvänds av upsert_taxa_bulk i SQLite-steget
+    db_state = {} if con is None else load_taxon_state(con)
+
+    cache_entries = _cache_species_load(cache_con, child_ids)
+
+    # Ett pass över child_ids: ogiltiga poster räknas, kända icke-arter släpps direkt och
+    # payloads som behövs samlas till en enda fråga. Andra loopen går bara över kandidaterna.
+    candidates: list[tuple[int, dict, int | None, str | None]] = []
+    need_payload: list[int] = []
     skipped_missing = 0
+    now = _now()
     for tid in child_ids:
-        obj = get_taxon_cached(cache_dir, tid, args.ttl_seconds)
-        if obj is None:
+        meta, is_species, species_row = cache_entries.get(tid, (None, None, None))
+        if not _cache_entry_valid(meta, args.ttl_seconds, now):
             skipped_missing += 1
             continue
-        if is_species_accepted_taxonomic(obj):
+        if is_species == 0:
+            continue
+        candidates.append((tid, meta, is_species, species_row))
+        if is_species is None or (con is not None and db_state.get(tid) != (meta["sha256"], 1)):
+            need_payload.append(tid)
+    payloads = _cache_payload_load(cache_con, need_payload)
+
+    items: list[tuple[dict, bytes | None, bytes]] = []
+    backfill: list[tuple[int, str | None, int]] = []
+    fast_unchanged = 0
+    for tid, meta, is_species, species_row in candidates:
+        blob = payloads.get(tid)
+        if blob is None:
             species_ids.append(tid)
-            species_table.append(extract_names(obj))
+            species_table.append(orjson.loads(species_row))
+            fast_unchanged += 1
+            continue
 
-    _dump_json(species_ids_file, {"lepidopteraTaxonId": lepidoptera_id, "speciesTaxonIds": species_ids})
-    _dump_json(species_table_file, {"lepidopteraTaxonId": lepidoptera_id, "species": species_table})
+        canon = _cache_decompress(blob)
+        obj = orjson.loads(canon)
+        if is_species is None:
+            is_species, species_row = _species_columns(obj)
+            backfill.append((is_species, species_row, tid))
+        if is_species:
+            species_ids.append(tid)
+            species_table.append(orjson.loads(species_row))
+            items.append((obj, meta["sha256"], canon))
+
+    if backfill:
+        _write_cache_species(cache_con, backfill)
+
+    # JSON-listorna skrivs i bakgrunden medan SQLite-steget kör (sqlite3 släpper GIL under
+    # sina anrop). Väntas in före write_source_rev så att ett fel aldrig ger fast-exit nästa gång.
+    dump_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dump")
+    dumps = [
+        dump_pool.submit(_dump_json, species_ids_file, {"lepidopteraTaxonId": lepidoptera_id, "speciesTaxonIds": species_ids}),
+        dump_pool.submit(_dump_json, species_table_file, {"lepidopteraTaxonId": lepidoptera_id, "species": species_table}),
+    ]
+    dump_pool.shutdown(wait=False)
 
     #print(f"Species count (Accepted/Taxonomic): {len(species_ids)}")
     #print(f"Cache miss before run: {before_missing}")
@@ -528,10 +1064,12 @@ def main() -> None:
         written_ok,
         skipped_missing,
     )
-    logger.info("Wrote: %s, %s",species_ids_file, species_table_file)
 
     # SQLite step
     if args.no_sqlite:
+        for fut in dumps:
+            fut.result()
+        logger.info("Wrote: %s, %s",species_ids_file, species_table_file)
         write_source_rev(source_rev_file, lepidoptera_id, child_ids, source_hash)
         #print("SQLite: skipped (--no-sqlite)")
         #print(f"Source rev: {source_rev_file}")
@@ -539,52 +1077,55 @@ def main() -> None:
         logger.info("=== Dyntaxa refresh finished ===")
         return
 
-    con = db_open(args.db)
-    run_id = begin_run(con, lepidoptera_id, len(child_ids), source_hash=source_hash)
-
-    inserted = updated = unchanged = 0
-    active_species: set[int] = set()
-
-    for tid in child_ids:
-        obj = get_taxon_cached(cache_dir, tid, args.ttl_seconds)
-        if obj is None:
-            continue
-        if not is_species_accepted_taxonomic(obj):
-            continue
-
-        _data_path, meta_path = _cache_paths(cache_dir, tid)
-        sha = None
-        if meta_path.exists():
-            try:
-                meta = _read_json(meta_path)
-                sha = meta.get("sha256")
-            except Exception:
-                sha = None
-        if sha is None:
-            sha = taxon_sha256(obj)
-
-        change = upsert_taxon(con, run_id, obj, sha, make_active=True)
-        if change == "inserted":
-            inserted += 1
-        elif change in ("updated", "reactivated"):
-            updated += 1
-        else:
-            unchanged += 1
-
-        active_species.add(tid)
-
-    deactivated = deactivate_missing_species(con, run_id, active_species)
-
-    end_run(
-        con,
-        run_id,
-        species_count=len(active_species),
-        inserted=inserted,
-        updated=updated,
-        unchanged=unchanged,
-        deactivated=deactivated,
-    )
-
+    # En tidsstämpel för körningen: runs.started_at, taxa.updated_at och changes.at
+    run_now = _now()
+    run_id = begin_run(con, lepidoptera_id, len(child_ids), source_hash=source_hash, now=run_now)
+
+    # Första körningen (tom taxa) eller --bulk-load: index byggs efter inläsningen i stället
+    # för per rad. fsync slås bara av när taxa är tom: en krasch kan då lämna filen korrupt,
+    # men den innehåller inget än. Etablerade databaser behåller WAL och full hållbarhet.
+    # Pragman ytterst: indexbygget i bulk_syncs exit körs då också utan fsync, före
+    # återställningen och WAL-checkpointen.
+    first_run = taxa_is_empty(con)
+    with (
+        bulk_load_pragmas(con) if first_run else nullcontext(),
+        bulk_sync(con, full_rebuild=args.bulk_load),
+    ):
+        # En transaktion för hela artpasset => en fsync i stället för en per taxon.
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            # taxa med samma sha som aktiv rad hoppades över i artpasset => oförändrade
+            inserted = updated = 0
+            unchanged = fast_unchanged
+            active_species: set[int] = set(species_ids)
+
+            for change in upsert_taxa_bulk(con, run_id, items, make_active=True, state=db_state, now=run_now):
+                if change == "inserted":
+                    inserted += 1
+                elif change in ("updated", "reactivated"):
+                    updated += 1
+                else:
+                    unchanged += 1
+
+            deactivated = deactivate_missing_species(con, run_id, active_species, now=run_now)
+
+            end_run(
+                con,
+                run_id,
+                species_count=len(active_species),
+                inserted=inserted,
+                updated=updated,
+                unchanged=unchanged,
+                deactivated=deactivated,
+            )
+        except BaseException:
+            # även KeyboardInterrupt: annars committar nästa executescript/commit halva laddningen
+            con.rollback()
+            raise
+
+    for fut in dumps:
+        fut.result()
+    logger.info("Wrote: %s, %s",species_ids_file, species_table_file)
     write_source_rev(source_rev_file, lepidoptera_id, child_ids, source_hash)
 
     #print(f"SQLite: inserted={inserted}, updated/reactivated={updated}, unchanged={unchanged}, deactivated={deactivated}")
@@ -19,14 +19,43 @@
 import json
 import sqlite3
 import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
+
+# orjson är betydligt snabbare, men modulen fungerar även med stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DB_PATH_DEFAULT = Path("./tmp/dyntaxa_lepidoptera.sqlite")
 
+SCHEMA_VERSION = 5
+RAW_JSON_COMPRESS_LEVEL = 6
+
+# Sekundärindex på taxa. Separat lista så att bulk_sync() kan släppa och bygga om dem
+# med exakt samma DDL som schemat.
+TAXA_INDEXES = (
+    ("idx_taxa_active", "CREATE INDEX IF NOT EXISTS idx_taxa_active ON taxa(is_active)"),
+    ("idx_taxa_category", "CREATE INDEX IF NOT EXISTS idx_taxa_category ON taxa(category)"),
+    ("idx_taxa_sciname", "CREATE INDEX IF NOT EXISTS idx_taxa_sciname ON taxa(sci_name)"),
+    # deaktiveringen och v_active_species filtrerar alltid på båda kolumnerna
+    ("idx_taxa_active_category", "CREATE INDEX IF NOT EXISTS idx_taxa_active_category ON taxa(is_active, category)"),
+)
+
 SCHEMA_SQL = """
 PRAGMA journal_mode=WAL;
 PRAGMA synchronous=NORMAL;
+-- anslutningsinställningar för bulksynk: 256 MB sidcache (tak, allokeras vid behov),
+-- temp-tabeller i minnet, mmap-läsning och glesare WAL-checkpoints
+-- (väntan vid lås: sqlite3.connect har redan timeout=5.0 som standard)
+PRAGMA cache_size=-262144;
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=1073741824;
+PRAGMA wal_autocheckpoint=10000;
 
 CREATE TABLE IF NOT EXISTS meta (
   key TEXT PRIMARY KEY,
@@ -43,14 +72,24 @@ CREATE TABLE IF NOT EXISTS taxa (
   status       TEXT,
   parent_id    INTEGER,
   is_active    INTEGER NOT NULL DEFAULT 1,
-  sha256       TEXT,
-  updated_at   INTEGER NOT NULL,
-  raw_json     TEXT
+  sha256       BLOB,            -- rå 32-byte digest sedan schema_version 5
+  updated_at   INTEGER NOT NULL
 );
 
-CREATE INDEX IF NOT EXISTS idx_taxa_active ON taxa(is_active);
-CREATE INDEX IF NOT EXISTS idx_taxa_category ON taxa(category);
-CREATE INDEX IF NOT EXISTS idx_taxa_sciname ON taxa(sci_name);
+-- Hela taxonobjektet (zlib-komprimerad kanonisk JSON) i en egen tabell, så att
+-- taxa-raderna förblir smala och klassningsläsningen inte rör overflow-sidor.
+CREATE TABLE IF NOT EXISTS taxa_raw (
+  taxon_id     INTEGER PRIMARY KEY,
+  raw_json     BLOB NOT NULL
+) WITHOUT ROWID;
+
+""" + "".join(ddl + ";\n" for _name, ddl in TAXA_INDEXES) + """
+
+-- Aktuella accepterade arter för nedströms läsare; samma filter som artpasset
+CREATE VIEW IF NOT EXISTS v_active_species AS
+SELECT taxon_id, local_index, sci_name, swe_name
+FROM taxa
+WHERE is_active=1 AND category='Species' AND type='Taxonomic' AND status='Accepted';
 
 CREATE TABLE IF NOT EXISTS runs (
   run_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -74,55 +113,279 @@ CREATE TABLE IF NOT EXISTS changes (
   run_id INTEGER NOT NULL,
   taxon_id INTEGER NOT NULL,
   change_type TEXT NOT NULL,      -- inserted, updated, deactivated, reactivated
-  old_sha256 TEXT,
-  new_sha256 TEXT,
+  old_sha256 BLOB,
+  new_sha256 BLOB,
   at INTEGER NOT NULL,
   FOREIGN KEY(run_id) REFERENCES runs(run_id)
 );
 """
 
+# Under en full inläsning: ingen fsync, rollback-journal i minnet, inga FK-kontroller.
+# Tidigare värden återställs efteråt. (cache_size/temp_store/mmap m.fl. sätts redan i
+# SCHEMA_SQL för hela anslutningen.)
+BULK_LOAD_PRAGMAS_SQL = """
+PRAGMA synchronous=OFF;
+PRAGMA journal_mode=MEMORY;
+PRAGMA foreign_keys=OFF;
+"""
+
+# Radbatchar vid strömmande läsning av hela taxa (load_taxon_state)
+STATE_FETCH_ROWS = 10000
+
+# Fasta SQL-strängar för de satser som körs ofta. sqlite3 cachar förberedda satser per
+# SQL-text, så samma text vid varje anrop (inga f-strängar med varierande IN-listor)
+# gör att satsen kompileras en gång per anslutning.
+DB_CACHED_STATEMENTS = 256
+
+SQL_META_GET = "SELECT value FROM meta WHERE key=?"
+SQL_META_SET = "INSERT INTO meta(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value"
+
+# Läs+skriv av räknaren i en sats (RETURNING kräver SQLite 3.35+); ger intervallets start
+SQL_ALLOC_LOCAL_INDEX_RANGE = """
+UPDATE meta SET value = CAST(value AS INTEGER) + ?
+WHERE key='next_local_index'
+RETURNING CAST(value AS INTEGER) - ?
+"""
+
+SQL_SELECT_TAXON_SHA = "SELECT sha256 FROM taxa WHERE taxon_id=?"
+SQL_SELECT_TAXON_RAW = "SELECT raw_json FROM taxa_raw WHERE taxon_id=?"
+SQL_SELECT_ALL_TAXA_STATE = "SELECT taxon_id, sha256, is_active FROM taxa"
+SQL_SELECT_TAXA_STATE = "SELECT taxon_id, sha256, is_active FROM taxa WHERE taxon_id IN (SELECT value FROM json_each(?))"
+
+# Nya och ändrade taxa i samma sats/executemany. DO UPDATE rör aldrig local_index;
+# WHERE-villkoret låter SQLite själv hoppa över no-op-uppdateringar om anroparens
+# förhandslästa tillstånd skulle vara inaktuellt.
+# local_index: befintlig rad behåller sitt värde (NOT NULL kontrolleras före konflikten,
+# så värdet måste finnas redan i VALUES); ?2 är det nyallokerade indexet för nya taxa
+# och NULL för rader som anroparen vet finns.
+SQL_UPSERT_TAXON = """
+INSERT INTO taxa(taxon_id, local_index, sci_name, swe_name, category, type, status, parent_id, is_active, sha256, updated_at)
+VALUES(?1,COALESCE((SELECT local_index FROM taxa WHERE taxon_id=?1),?2),?3,?4,?5,?6,?7,?8,?9,?10,?11)
+ON CONFLICT(taxon_id) DO UPDATE SET
+  sci_name=excluded.sci_name, swe_name=excluded.swe_name, category=excluded.category,
+  type=excluded.type, status=excluded.status, parent_id=excluded.parent_id,
+  is_active=excluded.is_active, sha256=excluded.sha256, updated_at=excluded.updated_at
+WHERE excluded.sha256 IS NULL OR excluded.sha256 IS NOT taxa.sha256 OR excluded.is_active IS NOT taxa.is_active
+"""
+SQL_UPSERT_TAXON_RAW = "INSERT INTO taxa_raw(taxon_id,raw_json) VALUES(?,?) ON CONFLICT(taxon_id) DO UPDATE SET raw_json=excluded.raw_json"
+SQL_INSERT_CHANGE = "INSERT INTO changes(run_id,taxon_id,change_type,old_sha256,new_sha256,at) VALUES(?,?,?,?,?,?)"
+
+# Mängddifferensen "aktiva arter i taxa minus dagens artlista" görs i SQLite som en
+# anti-join mot en temporär tabell med dagens artlista.
+SQL_CREATE_ACTIVE_IDS = "CREATE TEMP TABLE IF NOT EXISTS active_ids(taxon_id INTEGER PRIMARY KEY) WITHOUT ROWID"
+# artlistan som en JSON-parameter => en sats, inga Python-tupler per id
+SQL_INSERT_ACTIVE_IDS = "INSERT OR IGNORE INTO active_ids(taxon_id) SELECT value FROM json_each(?)"
+SQL_DROP_ACTIVE_IDS = "DROP TABLE IF EXISTS temp.active_ids"
+SQL_INSERT_DEACTIVATED_CHANGES = """
+INSERT INTO changes(run_id,taxon_id,change_type,old_sha256,new_sha256,at)
+SELECT ?, t.taxon_id, 'deactivated', t.sha256, t.sha256, ?
+FROM taxa t LEFT JOIN active_ids a USING(taxon_id)
+WHERE a.taxon_id IS NULL AND t.is_active=1 AND t.category='Species'
+ORDER BY t.taxon_id
+"""
+SQL_DEACTIVATE_TAXA = """
+UPDATE taxa SET is_active=0, updated_at=?
+WHERE is_active=1 AND category='Species'
+  AND NOT EXISTS (SELECT 1 FROM active_ids a WHERE a.taxon_id=taxa.taxon_id)
+"""
+
 def _now() -> int:
     return int(time.time())
 
+def _tuple_cursor(con: sqlite3.Connection) -> sqlite3.Cursor:
+    # Anslutningen har row_factory=sqlite3.Row; loopar över många rader läser vanliga
+    # tupler i stället (ingen Row-allokering, positionell uppackning).
+    cur = con.cursor()
+    cur.row_factory = None
+    return cur
+
+def canon_json_bytes(obj: Any) -> bytes:
+    # Den enda kanoniska kodningen (kompakt, sorterade nycklar, UTF-8). Samma bytes hashas
+    # och lagras som raw_json, så hash och raw_json kan aldrig glida isär.
+    # stdlib-reserven ger samma bytes för Dyntaxas data (strängar, heltal, listor, objekt).
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode()
+
+def _json_loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def _json_param(values: list) -> str:
+    # lista som JSON-text till json_each(?)
+    return orjson.dumps(values).decode() if orjson is not None else json.dumps(values)
+
 def db_open(db_path: Path | None = None) -> sqlite3.Connection:
     db_path = db_path or DB_PATH_DEFAULT
     db_path.parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(str(db_path))
+    con = sqlite3.connect(str(db_path), cached_statements=DB_CACHED_STATEMENTS)
     con.row_factory = sqlite3.Row
     con.executescript(SCHEMA_SQL)
 
     cur = con.cursor()
-    cur.execute("INSERT OR IGNORE INTO meta(key,value) VALUES('schema_version','2')")
+    cur.execute("INSERT OR IGNORE INTO meta(key,value) VALUES('schema_version',?)", (str(SCHEMA_VERSION),))
     cur.execute("INSERT OR IGNORE INTO meta(key,value) VALUES('next_local_index','0')")
     # NEW: store last source hash (optional convenience)
     cur.execute("INSERT OR IGNORE INTO meta(key,value) VALUES('last_source_hash','')")
+    # hashalgoritm för taxa.sha256; databaser från före valet är sha256
+    cur.execute("INSERT OR IGNORE INTO meta(key,value) VALUES('hash_algo','sha256')")
     con.commit()
+    _migrate(con)
     return con
 
+def _migrate(con: sqlite3.Connection) -> None:
+    version = int(_meta_get(con, "schema_version"))
+    if version < 3:
+        # raw_json TEXT -> zlib-BLOB (kolumnen behåller sin deklaration; SQLite lagrar BLOB som de är)
+        rows = [
+            (_raw_json_compress(raw_json.encode()), taxon_id)
+            for taxon_id, raw_json in con.execute("SELECT taxon_id, raw_json FROM taxa WHERE typeof(raw_json)='text'")
+        ]
+        con.executemany("UPDATE taxa SET raw_json=? WHERE taxon_id=?", rows)
+        _meta_set(con, "schema_version", "3")
+        con.commit()
+    if version < 4:
+        # taxa.raw_json -> taxa_raw (DROP COLUMN kräver SQLite 3.35+)
+        columns = {r[1] for r in con.execute("PRAGMA table_info(taxa)")}
+        if "raw_json" in columns:
+            con.execute("INSERT OR IGNORE INTO taxa_raw(taxon_id, raw_json) SELECT taxon_id, raw_json FROM taxa WHERE raw_json IS NOT NULL")
+            con.execute("ALTER TABLE taxa DROP COLUMN raw_json")
+        _meta_set(con, "schema_version", "4")
+        con.commit()
+    if version < 5:
+        # hex-text -> 32-byte BLOB (kolumnerna behåller sin deklaration i äldre databaser)
+        con.create_function("hex_to_digest", 1, bytes.fromhex, deterministic=True)
+        con.execute("UPDATE taxa SET sha256=hex_to_digest(sha256) WHERE typeof(sha256)='text'")
+        con.execute("UPDATE changes SET old_sha256=hex_to_digest(old_sha256) WHERE typeof(old_sha256)='text'")
+        con.execute("UPDATE changes SET new_sha256=hex_to_digest(new_sha256) WHERE typeof(new_sha256)='text'")
+        _meta_set(con, "schema_version", "5")
+        con.commit()
+
+def _raw_json_compress(canon: bytes) -> bytes:
+    return zlib.compress(canon, RAW_JSON_COMPRESS_LEVEL)
+
+def _raw_json_bytes(value: bytes | str) -> bytes:
+    # TEXT-värden kan finnas kvar om databasen skrivits av en äldre version efter migreringen
+    if isinstance(value, str):
+        return value.encode()
+    return zlib.decompress(value)
+
+def taxon_raw_json(con: sqlite3.Connection, taxon_id: int) -> dict | None:
+    """Hela taxonobjektet som det senast lagrades, eller None."""
+    row = con.execute(SQL_SELECT_TAXON_RAW, (taxon_id,)).fetchone()
+    if row is None or row[0] is None:
+        return None
+    return _json_loads(_raw_json_bytes(row[0]))
+
+@contextmanager
+def bulk_load_pragmas(con: sqlite3.Connection):
+    """
+    Slå av fsync/WAL under en inläsning och återställ de tidigare värdena efteråt,
+    följt av en WAL-checkpoint som trunkerar WAL-filen.
+    Endast för första körningen (tom taxa): med journalen i minnet kan en krasch mitt
+    i laddningen lämna databasfilen korrupt, vilket bara går an när den inte innehåller
+    något än => radera filen och kör om. Etablerade databaser behåller full hållbarhet.
+    Måste anropas utanför en öppen transaktion (journal_mode kan inte bytas i en).
+    """
+    journal_mode = con.execute("PRAGMA journal_mode").fetchone()[0]
+    synchronous = int(con.execute("PRAGMA synchronous").fetchone()[0])
+    foreign_keys = int(con.execute("PRAGMA foreign_keys").fetchone()[0])
+    con.executescript(BULK_LOAD_PRAGMAS_SQL)
+    try:
+        yield con
+    finally:
+        # executescript committar en öppen transaktion => rulla tillbaka ett avbrutet
+        # block först i stället för att spara halvskriven data
+        if con.in_transaction:
+            con.rollback()
+        con.executescript(
+            f"PRAGMA journal_mode={journal_mode};\n"
+            f"PRAGMA synchronous={synchronous};\n"
+            f"PRAGMA foreign_keys={foreign_keys};\n"
+        )
+        if journal_mode.lower() == "wal":
+            # main.: utan schema försöker checkpointen även temp-databasen (active_ids)
+            # och kan ge "database table is locked"
+            con.execute("PRAGMA main.wal_checkpoint(TRUNCATE)").fetchall()
+
+@contextmanager
+def bulk_sync(con: sqlite3.Connection, *, full_rebuild: bool = False):
+    """
+    Släpp taxa-sekundärindexen under en första (tom taxa) eller uttryckligen begärd
+    bulkinläsning och bygg om dem efteråt i ett svep, i stället för att underhålla dem
+    rad för rad. Vid vanliga inkrementella körningar lämnas indexen orörda.
+    Måste anropas utanför en öppen transaktion. Ger True om indexen släpptes.
+    """
+    rebuild = full_rebuild or taxa_is_empty(con)
+    if rebuild:
+        for name, _ddl in TAXA_INDEXES:
+            con.execute(f"DROP INDEX IF EXISTS {name}")
+        con.commit()
+    try:
+        yield rebuild
+    finally:
+        # Indexbygget committar => rulla tillbaka ett avbrutet block först
+        if con.in_transaction:
+            con.rollback()
+        if rebuild:
+            for _name, ddl in TAXA_INDEXES:
+                con.execute(ddl)
+            con.commit()
+
+def taxa_is_empty(con: sqlite3.Connection) -> bool:
+    return con.execute("SELECT 1 FROM taxa LIMIT 1").fetchone() is None
+
 def _meta_get(con: sqlite3.Connection, key: str) -> str:
-    row = con.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+    row = con.execute(SQL_META_GET, (key,)).fetchone()
     if not row:
         raise RuntimeError(f"Missing meta key: {key}")
     return str(row["value"])
 
 def _meta_set(con: sqlite3.Connection, key: str, value: str) -> None:
-    con.execute(
-        "INSERT INTO meta(key,value) VALUES(?,?) "
-        "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-        (key, value),
-    )
+    con.execute(SQL_META_SET, (key, value))
+
+def alloc_local_index_range(con: sqlite3.Connection, count: int) -> int:
+    """
+    Reservera count på varandra följande local_index och returnera det första.
+    Körs inom anroparens transaktion (se upsert_taxa_bulk).
+    """
+    row = con.execute(SQL_ALLOC_LOCAL_INDEX_RANGE, (count, count)).fetchone()
+    if row is None:
+        raise RuntimeError("Missing meta key: next_local_index")
+    return int(row[0])
 
 def alloc_local_index(con: sqlite3.Connection) -> int:
-    con.execute("BEGIN IMMEDIATE")
-    next_idx = int(_meta_get(con, "next_local_index"))
-    _meta_set(con, "next_local_index", str(next_idx + 1))
+    return alloc_local_index_range(con, 1)
+
+def ensure_hash_algo(con: sqlite3.Connection, algo: str, hash_fn: Callable[[bytes], bytes]) -> int:
+    """
+    Räkna om taxa.sha256 från taxa_raw om databasen hashades med en annan algoritm,
+    så att ett byte av algoritm inte ger en 'updated' per taxon. Returnerar antal rader.
+    """
+    if _meta_get(con, "hash_algo") == algo:
+        return 0
+    # Strömmas: en rad i taget från taxa_raw rakt in i executemany mot taxa (annan
+    # tabell => säkert att uppdatera medan läsningen pågår), inga payloadlistor i minnet.
+    cur = _tuple_cursor(con).execute("SELECT taxon_id, raw_json FROM taxa_raw")
+    updated = con.executemany(
+        "UPDATE taxa SET sha256=? WHERE taxon_id=?",
+        ((hash_fn(_raw_json_bytes(raw_json)), taxon_id) for taxon_id, raw_json in cur),
+    ).rowcount
+    _meta_set(con, "hash_algo", algo)
     con.commit()
-    return next_idx
+    return updated
 
-def begin_run(con: sqlite3.Connection, lepidoptera_taxon_id: int, child_ids_count: int, source_hash: str | None = None) -> int:
+def begin_run(
+    con: sqlite3.Connection,
+    lepidoptera_taxon_id: int,
+    child_ids_count: int,
+    source_hash: str | None = None,
+    *,
+    now: int | None = None
+) -> int:
+    # now = körningens tidsstämpel; skicka samma värde till upsert/deactivate
     cur = con.execute(
         "INSERT INTO runs(started_at, lepidoptera_taxon_id, child_ids_count, source_hash) VALUES(?,?,?,?)",
-        (_now(), lepidoptera_taxon_id, child_ids_count, source_hash),
+        (now if now is not None else _now(), lepidoptera_taxon_id, child_ids_count, source_hash),
     )
     # keep meta updated as convenience (not required)
     if source_hash is not None:
@@ -154,129 +417,211 @@ def _pick_names_from_taxon_obj(taxon_obj: dict) -> tuple[str | None, str | None]
     # taxonservice POST /taxa returnerar fältet "names": [...]
     sci = None
     swe = None
-    for n in taxon_obj.get("names") or []:
-        cat = (n.get("category") or {}).get("value")
+    for n in taxon_obj.get("names") or ():
         name = n.get("name")
         if not name:
             continue
+        cat_obj = n.get("category")
+        cat = cat_obj.get("value") if cat_obj else None
         # ta första bästa; upstream verkar returnera recommended först, men vi är robusta
-        if cat == "ScientificName" and sci is None:
-            sci = name
-        if cat == "SwedishName" and swe is None:
-            swe = name
+        if cat == "ScientificName":
+            if sci is None:
+                sci = name
+        elif cat == "SwedishName":
+            if swe is None:
+                swe = name
+        if sci is not None and swe is not None:
+            break
     return sci, swe
 
-def get_taxon_sha(con: sqlite3.Connection, taxon_id: int) -> str | None:
-    row = con.execute("SELECT sha256 FROM taxa WHERE taxon_id=?", (taxon_id,)).fetchone()
-    return str(row["sha256"]) if row and row["sha256"] is not None else None
+def get_taxon_sha(con: sqlite3.Connection, taxon_id: int) -> bytes | None:
+    row = con.execute(SQL_SELECT_TAXON_SHA, (taxon_id,)).fetchone()
+    return bytes(row["sha256"]) if row and row["sha256"] is not None else None
 
-def upsert_taxon(
-    con: sqlite3.Connection,
-    run_id: int,
-    taxon_obj: dict,
-    sha256: str | None,
-    *,
-    make_active: bool = True
-) -> str:
+def load_taxon_state(con: sqlite3.Connection) -> dict[int, tuple[bytes | None, int]]:
     """
-    Returnerar change_type: inserted/updated/unchanged/reactivated
-    Idempotent: om sha är samma och redan aktiv => ingen write.
+    taxon_id -> (sha256, is_active) för hela taxa, läst i ett svep.
+    Används både för att hoppa över oförändrade taxa före avkodning och som
+    förhandsläst tillstånd till upsert_taxa_bulk (inga frågor per taxon).
     """
-    taxon_id = int(taxon_obj.get("taxonId"))
+    out: dict[int, tuple[bytes | None, int]] = {}
+    cur = _tuple_cursor(con).execute(SQL_SELECT_ALL_TAXA_STATE)
+    while rows := cur.fetchmany(STATE_FETCH_ROWS):
+        for taxon_id, sha256, is_active in rows:
+            out[taxon_id] = (sha256, is_active)
+    return out
+
+def _taxon_row_values(taxon_obj: dict, canon: bytes | None = None) -> tuple[str | None, str | None, Any, Any, Any, Any, bytes]:
     parent_id = taxon_obj.get("parentId")
     category = (taxon_obj.get("category") or {}).get("value")
     ttype = (taxon_obj.get("type") or {}).get("value")
     status = (taxon_obj.get("status") or {}).get("value")
     sci, swe = _pick_names_from_taxon_obj(taxon_obj)
+    # canon = redan kanoniska (sorterade, kompakta) bytes från cachen => ingen omkodning
+    if canon is None:
+        canon = canon_json_bytes(taxon_obj)
+    return sci, swe, category, ttype, status, parent_id, _raw_json_compress(canon)
+
+def _load_taxa_state(con: sqlite3.Connection, taxon_ids: list[int]) -> dict[int, tuple[bytes | None, int]]:
+    # id-listan skickas som en JSON-parameter => en och samma sats oavsett antal id:n
+    out: dict[int, tuple[bytes | None, int]] = {}
+    for taxon_id, sha256, is_active in _tuple_cursor(con).execute(SQL_SELECT_TAXA_STATE, (_json_param(taxon_ids),)):
+        out[taxon_id] = (sha256, is_active)
+    return out
+
+def upsert_taxa_bulk(
+    con: sqlite3.Connection,
+    run_id: int,
+    items: list[tuple],
+    *,
+    make_active: bool = True,
+    state: dict[int, tuple[bytes | None, int]] | None = None,
+    now: int | None = None
+) -> list[str]:
+    """
+    Bulkvariant av upsert_taxon för (taxon_obj, sha256[, canon_bytes])-tupler.
+    canon_bytes är payloadens kanoniska JSON (t.ex. från cachen) och lagras som raw_json
+    utan att objektet kodas om.
+    Klassar alla rader mot en förhandsläsning av taxa och skriver med executemany.
+    state = tillstånd från load_taxon_state() som anroparen redan läst; annars läses
+    raderna för items här. Läses bara: rullas transaktionen tillbaka gäller det oförändrat
+    vid ett nytt försök.
+    now = körningens tidsstämpel (updated_at/changes.at), annars tidpunkten för anropet.
+    Returnerar change_type per rad i samma ordning som items.
+    Committar inte; anroparen håller transaktionen.
+    """
+    taxon_ids = [int(item[0].get("taxonId")) for item in items]
+    if state is None:
+        state = _load_taxa_state(con, taxon_ids)
+
+    if now is None:
+        now = _now()
+    rows: list[tuple] = []
+    new_rows: list[int] = []
+    raws: list[tuple] = []
+    changes: list[tuple] = []
+    result: list[str] = []
+    seen: set[int] = set()
+
+    for taxon_id, item in zip(taxon_ids, items):
+        obj, sha256 = item[0], item[1]
+        if taxon_id in seen:
+            result.append("unchanged")
+            continue
+        seen.add(taxon_id)
+
+        old = state.get(taxon_id)
+        if old is None:
+            sci, swe, category, ttype, status, parent_id, raw_json = _taxon_row_values(obj, item[2] if len(item) > 2 else None)
+            # local_index fylls i nedan när antalet nya taxa är känt
+            new_rows.append(len(rows))
+            rows.append((taxon_id, None, sci, swe, category, ttype, status, parent_id, 1 if make_active else 0, sha256, now))
+            raws.append((taxon_id, raw_json))
+            changes.append((run_id, taxon_id, "inserted", None, sha256, now))
+            result.append("inserted")
+            continue
 
-    now = _now()
-    raw_json = json.dumps(taxon_obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+        old_sha, old_active = old
 
-    row = con.execute(
-        "SELECT taxon_id, local_index, sha256, is_active FROM taxa WHERE taxon_id=?",
-        (taxon_id,),
-    ).fetchone()
+        # if unchanged and already active => no-op
+        if make_active and old_active == 1 and sha256 is not None and old_sha == sha256:
+            result.append("unchanged")
+            continue
 
-    if row is None:
-        local_index = alloc_local_index(con)
-        con.execute(
-            """
-            INSERT INTO taxa(taxon_id, local_index, sci_name, swe_name, category, type, status, parent_id, is_active, sha256, updated_at, raw_json)
-            VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
-            """,
-            (taxon_id, local_index, sci, swe, category, ttype, status, parent_id, 1 if make_active else 0, sha256, now, raw_json),
-        )
-        con.execute(
-            "INSERT INTO changes(run_id,taxon_id,change_type,old_sha256,new_sha256,at) VALUES(?,?,?,?,?,?)",
-            (run_id, taxon_id, "inserted", None, sha256, now),
-        )
-        con.commit()
-        return "inserted"
-
-    old_sha = row["sha256"]
-    old_active = int(row["is_active"])
-
-    # if unchanged and already active => no-op
-    if make_active and old_active == 1 and sha256 is not None and old_sha == sha256:
-        return "unchanged"
-
-    # reactivation (was inactive)
-    if make_active and old_active == 0:
-        con.execute(
-            """
-            UPDATE taxa
-            SET sci_name=?, swe_name=?, category=?, type=?, status=?, parent_id=?, is_active=1, sha256=?, updated_at=?, raw_json=?
-            WHERE taxon_id=?
-            """,
-            (sci, swe, category, ttype, status, parent_id, sha256, now, raw_json, taxon_id),
-        )
-        con.execute(
-            "INSERT INTO changes(run_id,taxon_id,change_type,old_sha256,new_sha256,at) VALUES(?,?,?,?,?,?)",
-            (run_id, taxon_id, "reactivated", old_sha, sha256, now),
-        )
-        con.commit()
-        return "reactivated"
-
-    # update if sha differs OR sha missing
-    if sha256 is None or old_sha != sha256:
-        con.execute(
-            """
-            UPDATE taxa
-            SET sci_name=?, swe_name=?, category=?, type=?, status=?, parent_id=?, is_active=?, sha256=?, updated_at=?, raw_json=?
-            WHERE taxon_id=?
-            """,
-            (sci, swe, category, ttype, status, parent_id, 1 if make_active else old_active, sha256, now, raw_json, taxon_id),
-        )
-        con.execute(
-            "INSERT INTO changes(run_id,taxon_id,change_type,old_sha256,new_sha256,at) VALUES(?,?,?,?,?,?)",
-            (run_id, taxon_id, "updated", old_sha, sha256, now),
-        )
+        # reactivation (was inactive)
+        if make_active and old_active == 0:
+            change = "reactivated"
+        # update if sha differs OR sha missing
+        elif sha256 is None or old_sha != sha256:
+            change = "updated"
+        else:
+            result.append("unchanged")
+            continue
+
+        # radvärden (inkl. raw_json) byggs bara för rader som faktiskt skrivs
+        sci, swe, category, ttype, status, parent_id, raw_json = _taxon_row_values(obj, item[2] if len(item) > 2 else None)
+        rows.append((taxon_id, None, sci, swe, category, ttype, status, parent_id, 1 if make_active else old_active, sha256, now))
+        raws.append((taxon_id, raw_json))
+        changes.append((run_id, taxon_id, change, old_sha, sha256, now))
+        result.append(change)
+
+    if new_rows:
+        # Ett meta-anrop för hela intervallet; index delas ut i items-ordning som tidigare.
+        base = alloc_local_index_range(con, len(new_rows))
+        for i, pos in enumerate(new_rows):
+            row = rows[pos]
+            rows[pos] = (row[0], base + i, *row[2:])
+    if rows:
+        con.executemany(SQL_UPSERT_TAXON, rows)
+    if raws:
+        con.executemany(SQL_UPSERT_TAXON_RAW, raws)
+    if changes:
+        con.executemany(SQL_INSERT_CHANGE, changes)
+    return result
+
+def upsert_taxa(
+    con: sqlite3.Connection,
+    run_id: int,
+    items: list[tuple],
+    *,
+    make_active: bool = True,
+    now: int | None = None
+) -> Counter:
+    """
+    Fristående bulk-upsert: egen BEGIN IMMEDIATE ... commit runt upsert_taxa_bulk.
+    Returnerar antal per change_type. Anropare som redan håller en transaktion
+    (t.ex. create_refresh_list.main) använder upsert_taxa_bulk direkt.
+    """
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        result = upsert_taxa_bulk(con, run_id, items, make_active=make_active, now=now)
         con.commit()
-        return "updated"
+    except BaseException:
+        # även KeyboardInterrupt: en avbruten transaktion får aldrig committas senare
+        con.rollback()
+        raise
+    return Counter(result)
 
-    return "unchanged"
+def upsert_taxon(
+    con: sqlite3.Connection,
+    run_id: int,
+    taxon_obj: dict,
+    sha256: bytes | None,
+    *,
+    make_active: bool = True,
+    raw_bytes: bytes | None = None,
+    now: int | None = None
+) -> str:
+    """
+    Returnerar change_type: inserted/updated/unchanged/reactivated
+    Idempotent: om sha är samma och redan aktiv => ingen write.
+    raw_bytes = de kanoniska bytes som sha256 räknades på; lagras direkt som raw_json
+    i stället för att objektet kodas om.
+    Committar inte; anroparen håller transaktionen (BEGIN IMMEDIATE ... commit).
+    """
+    return upsert_taxa_bulk(con, run_id, [(taxon_obj, sha256, raw_bytes)], make_active=make_active, now=now)[0]
 
-def deactivate_missing_species(con: sqlite3.Connection, run_id: int, active_taxon_ids: set[int]) -> int:
+def deactivate_missing_species(
+    con: sqlite3.Connection,
+    run_id: int,
+    active_taxon_ids: set[int],
+    *,
+    now: int | None = None
+) -> int:
     """
     Markera arter som inte längre finns i dagens species-lista som is_active=0.
     Returnerar hur många som deaktiverades.
+    Committar inte; körs inom anroparens transaktion.
     """
-    now = _now()
-    rows = con.execute(
-        "SELECT taxon_id, sha256 FROM taxa WHERE is_active=1 AND category='Species'"
-    ).fetchall()
-
-    to_deactivate = [int(r["taxon_id"]) for r in rows if int(r["taxon_id"]) not in active_taxon_ids]
-    if not to_deactivate:
-        return 0
-
-    con.execute("BEGIN IMMEDIATE")
-    for tid in to_deactivate:
-        old_sha = con.execute("SELECT sha256 FROM taxa WHERE taxon_id=?", (tid,)).fetchone()["sha256"]
-        con.execute("UPDATE taxa SET is_active=0, updated_at=? WHERE taxon_id=?", (now, tid))
-        con.execute(
-            "INSERT INTO changes(run_id,taxon_id,change_type,old_sha256,new_sha256,at) VALUES(?,?,?,?,?,?)",
-            (run_id, tid, "deactivated", old_sha, old_sha, now),
-        )
-    con.commit()
-    return len(to_deactivate)
+    if now is None:
+        now = _now()
+    # Dagens artlista in i en temp-tabell, sedan två mängdbaserade satser (anti-join);
+    # ingen id-lista läses upp till Python.
+    con.execute(SQL_DROP_ACTIVE_IDS)
+    con.execute(SQL_CREATE_ACTIVE_IDS)
+    try:
+        con.execute(SQL_INSERT_ACTIVE_IDS, (_json_param(list(active_taxon_ids)),))
+        con.execute(SQL_INSERT_DEACTIVATED_CHANGES, (run_id, now))
+        return con.execute(SQL_DEACTIVATE_TAXA, (now,)).rowcount
+    finally:
+        con.execute(SQL_DROP_ACTIVE_IDS)